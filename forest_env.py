@@ -3,7 +3,6 @@ forest_env.py - Complete implementation of the Forest Environment for RL
 """
 
 import math
-import random
 import numpy as np
 import gymnasium as gym
 from gymnasium import spaces
@@ -11,72 +10,66 @@ import matplotlib
 
 matplotlib.use("Agg")
 from matplotlib import pyplot as plt
+from matplotlib.colors import hsv_to_rgb
+from matplotlib.patches import Patch
 import subprocess
 import os
-import sqlite3
 import pandas as pd
-from skimage.draw import random_shapes
 
+from iland_output import (
+    connect_output,
+    connect_output_duckdb,
+    get_total_carbon,
+    read_carbon,
+    read_table,
+)
 
-def read_table(db_path="output.sqlite", table_name="stand") -> pd.DataFrame:
-    """
-    Read the contents of the 'stand' table from the SQLite database file.
-
-    Args:
-        db_path (str): Path to the SQLite database file
-        table_name (str): Name of the table to read
-
-    Returns:
-        DataFrame: Contents of the 'stand' table
-    """
-    # Check if the file exists
-    if not os.path.isfile(db_path):
-        print(f"Error: Database file '{db_path}' not found.")
-        return None
-
-    try:
-        # Connect to SQLite database
-        conn = sqlite3.connect(db_path)
-
-        # Query the stand table
-        df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-
-        # Close the connection
-        conn.close()
-
-        return df
+try:
+    from numba import njit
+except ImportError:  # Numba is optional, the NumPy kernels below are used instead
+    njit = None
 
-    except sqlite3.Error as e:
-        print(f"SQLite error: {e}")
-    except Exception as e:
-        print(f"Error: {e}")
+# Number of keepout masks generated up front and sampled on reset
+KEEPOUT_POOL_SIZE = 16
 
-    return None
 
+def nearest_distance(points: np.ndarray, x: float, y: float) -> float:
+    """
+    Distance from (x, y) to the closest of the given (N, 2) points.
+    """
+    delta = points - np.array([x, y], dtype=points.dtype)
+    return float(np.sqrt((delta**2).sum(axis=1)).min())
 
-def get_total_carbon(data: pd.DataFrame, year: int):
-    # Sum the branch mass for all trees in the final year
-    total_branch_mass = data[data["year"] == year]["branchMass"].sum()
-    # print(f"Total branch mass in the final year: {total_branch_mass:.2f} kg")
 
-    # Same for the stem mass, coarse root mass, and fine root mass
-    total_stem_mass = data[data["year"] == year]["stemMass"].sum()
-    # print(f"Total stem mass in the final year: {total_stem_mass:.2f} kg")
+def update_min_distance(min_dist: np.ndarray, x: float, y: float):
+    """
+    Lower each cell of min_dist (indexed [i, j]) to its distance from the
+    point (x, y), in place.
+    """
+    rows = np.arange(min_dist.shape[0], dtype=min_dist.dtype)[:, None]
+    cols = np.arange(min_dist.shape[1], dtype=min_dist.dtype)[None, :]
+    np.minimum(min_dist, np.hypot(rows - x, cols - y), out=min_dist)
 
-    total_coarse_root_mass = data[data["year"] == year]["coarseRootMass"].sum()
-    # print(f"Total coarse root mass in the final year: {total_coarse_root_mass:.2f} kg")
 
-    total_fine_root_mass = data[data["year"] == year]["fineRootMass"].sum()
-    # print(f"Total fine root mass in the final year: {total_fine_root_mass:.2f} kg")
+if njit is not None:
+    # Compiled versions fuse the arithmetic into one loop without temporaries
 
-    total_carbon_kg = (
-        total_branch_mass
-        + total_stem_mass
-        + total_coarse_root_mass
-        + total_fine_root_mass
-    ) * 0.5  # 50% of the mass is carbon
+    @njit(cache=True)
+    def nearest_distance(points, x, y):
+        best = np.inf
+        for k in range(points.shape[0]):
+            dx = points[k, 0] - x
+            dy = points[k, 1] - y
+            best = min(best, dx * dx + dy * dy)
+        return np.sqrt(best)
 
-    return total_carbon_kg
+    @njit(cache=True)
+    def update_min_distance(min_dist, x, y):
+        for i in range(min_dist.shape[0]):
+            for j in range(min_dist.shape[1]):
+                dist = np.sqrt((i - x) ** 2 + (j - y) ** 2)
+                if dist < min_dist[i, j]:
+                    min_dist[i, j] = dist
 
 
 class ForestEnv(gym.Env):
@@ -94,16 +87,48 @@ class ForestEnv(gym.Env):
         years=10,
         num_seedlings=100,
         grid_size=100,
+        xml_path="data/project.xml",
+        debug_output=False,
+        carbon_source="worker",
+        process_index=None,
     ):
         super(ForestEnv, self).__init__()
         self.render_mode = render_mode
         self.years = years
+        self.xml_path = xml_path
+        self.init_path = "data/seedling_init.txt"
+        self.db_path = "output.sqlite"
+        # With a process index, this environment gets its own project, seedling
+        # and output files so that several can run side by side
+        self.process_index = process_index
+        if process_index is not None:
+            self._set_up_process_files()
+        self.debug_output = debug_output  # Read the full tree table from SQLite
+        # Where the total carbon comes from: the iLand worker's reply
+        # ("worker"), or the output database aggregated by "sqlite" or "duckdb"
+        assert carbon_source in ("worker", "sqlite", "duckdb")
+        self.carbon_source = carbon_source
         self.grid_size = grid_size
         self.total_seedlings = num_seedlings
         self.seedlings_planted = []
         self.previous_carbon = 0.0
         self.species_names = species_names
-        self.keepout = self.get_random_keepout_mask(grid_size)
+        self._mask_pool = None
+        # Drawn from self.np_random on every reset, after any seeding
+        self.keepout = np.zeros((grid_size, grid_size), dtype=bool)
+
+        # Planted seedling positions, kept in a preallocated array so the
+        # distance checks below run as single vectorized operations
+        self._points = np.empty((num_seedlings, 2), dtype=np.float32)
+        self._cells = np.empty((num_seedlings, 2), dtype=np.int32)  # Clamped grid x, y
+        self._species_idx = np.empty(num_seedlings, dtype=np.int32)
+        self._n_planted = 0
+
+        # Running minimum distance from every cell to its nearest seedling.
+        # Updated incrementally on each planting.
+        self._min_dist = np.full((grid_size, grid_size), np.inf, dtype=np.float32)
+
+        self._reset_observation()
 
         self.action_space = spaces.Box(-1, 1, shape=(3,), dtype=np.float32)
 
@@ -125,46 +150,117 @@ class ForestEnv(gym.Env):
 
         self.num_failed_plantings = 0
 
+        # Distinct color per species, with hues spread evenly around the
+        # color wheel. Used by the "human" render mode.
+        hues = np.arange(len(species_names)) / len(species_names)
+        hsv = np.stack([hues, np.ones_like(hues), np.ones_like(hues)], axis=-1)
+        self._species_colors = (hsv_to_rgb(hsv) * 255).astype(np.uint8)
+
+        # Figure reused across "human" renders, created on first use
+        self._fig = None
+
+        # Persistent iLand worker, started on the first simulation
+        self._proc = None
+        self._worker_carbon = None  # Total carbon reported by the last run
+
+        # Seedling file, rewritten on reset and appended to on each planting
+        self._seedling_f = None
+
+        # Connection to the simulation output, opened on first use
+        self._db_conn = None
+
+    def _set_up_process_files(self):
+        """
+        Write a copy of the project file next to the original, pointing the
+        seedling file and the output database at names suffixed with the
+        process index. Relative paths in the copy resolve as in the original.
+        """
+        suffix = f"_{self.process_index}"
+        root, ext = os.path.splitext(self.xml_path)
+        dest_xml_path = f"{root}{suffix}{ext}"
+
+        try:
+            with open(self.xml_path, encoding="utf-8", newline="") as f:
+                xml_text = f.read()
+
+            xml_text = xml_text.replace(
+                ">seedling_init.txt<", f">seedling_init{suffix}.txt<"
+            ).replace(">output.sqlite<", f">output{suffix}.sqlite<")
+
+            with open(dest_xml_path, "w", encoding="utf-8", newline="") as f:
+                f.write(xml_text)
+
+        except Exception as e:
+            print(f"Error writing {dest_xml_path} from {self.xml_path}: {e}")
+            return
+
+        self.xml_path = dest_xml_path
+        self.init_path = f"data/seedling_init{suffix}.txt"
+        self.db_path = f"output{suffix}.sqlite"
+
     def get_random_keepout_mask(self, size):
+        """
+        Return a keepout mask sampled from a pool generated on first use.
+        Both the pool and the choice from it come from self.np_random, so
+        seeded resets reproduce the same layouts.
+        TRUE means "don't plant here".
+        """
+        if self._mask_pool is None:
+            self._mask_pool = [
+                self.build_keepout_mask(size) for _ in range(KEEPOUT_POOL_SIZE)
+            ]
 
-        # TRUE means "don't plant here"
+        index = self.np_random.integers(len(self._mask_pool))
+        return self._mask_pool[index].copy()
 
-        if random.random() < 0.5:
+    def build_keepout_mask(self, size):
+        """
+        Draw a random keepout mask directly into a boolean array.
+        TRUE means "don't plant here".
+        """
+        rng = self.np_random
+        rows, cols = np.ogrid[:size, :size]
+        mask = np.zeros((size, size), dtype=bool)
+
+        def disk(diameter):
+            # Keep the whole disk inside the grid
+            radius = diameter / 2
+            cy = rng.uniform(radius, size - radius)
+            cx = rng.uniform(radius, size - radius)
+            return (rows - cy) ** 2 + (cols - cx) ** 2 <= radius**2
+
+        if rng.random() < 0.5:
             # Create a random keepout mask with shapes.
             # Trees can only be planted OUTSIDE the shapes.
             # The shapes represent areas where trees cannot be planted,
             # such as roads or buildings.
-            image, labels = random_shapes(
-                (size, size),
-                max_shapes=10,
-                min_shapes=1,
-                min_size=size // 8,
-                max_size=size // 4,
-                allow_overlap=True,
-                channel_axis=None,
-            )
-
-            # This is the area not populated by any shape
-            mask = image < 255
+            min_size, max_size = size // 8, size // 4
+            for _ in range(rng.integers(1, 11)):
+                extent = rng.integers(min_size, max_size + 1)
+                if rng.random() < 0.5:
+                    top = rng.integers(max(1, size - extent))
+                    left = rng.integers(max(1, size - extent))
+                    height = rng.integers(min_size, max_size + 1)
+                    mask[top : top + height, left : left + extent] = True
+                else:
+                    mask |= disk(extent)
 
         else:
             # Create a random mask with shapes
             # Trees can only be planted WITHIN the shapes
             # in this case. This is to mimick the circles found in
             # Miyawaki forests.
-            image, labels = random_shapes(
-                (size, size),
-                max_shapes=10,
-                min_shapes=1,
-                min_size=size // 4,
-                max_size=size // 2,
-                allow_overlap=False,
-                channel_axis=None,
-                shape="circle",
-            )
-
-            # This is the area that IS populated by any shape
-            mask = image == 255
+            circles = np.zeros((size, size), dtype=bool)
+            for _ in range(rng.integers(1, 11)):
+                # Retry a few times to place a circle without overlap
+                for _ in range(100):
+                    circle = disk(rng.integers(size // 4, size // 2 + 1))
+                    if circle.any() and not (circles & circle).any():
+                        circles |= circle
+                        break
+
+            # This is the area that is NOT populated by any shape
+            mask = ~circles
 
         return mask
 
@@ -175,42 +271,20 @@ class ForestEnv(gym.Env):
         - Empty space where seedlings can be planted (0)
         - Keepout area where seedlings cannot be planted (1)
         - Planted seedlings (2 + species_index)
+
+        The observation is maintained incrementally and returned without
+        copying, so callers that keep it across steps must copy it.
         """
-        # Base observation with keepout areas
-        obs = np.zeros(
-            (self.grid_size, self.grid_size, 2), dtype=np.float32
-        )  # Changed to 2 channels
-        obs[:, :, 0] = self.keepout
-
-        # Add seedlings
-        for seedling in self.seedlings_planted:
-            # Ensure coordinates are within bounds by clamping them
-            x = min(int(seedling[0]), self.grid_size - 1)  # Clamp to grid_size - 1
-            y = min(int(seedling[1]), self.grid_size - 1)  # Clamp to grid_size - 1
-
-            # Ensure x and y are non-negative
-            x = max(0, x)
-            y = max(0, y)
-
-            species_index = seedling[2]
-            obs[x, y, 0] = species_index + 2
-
-        # Add distance field in second channel
-        for i in range(self.grid_size):
-            for j in range(self.grid_size):
-                min_dist = float("inf")
-                for seedling in self.seedlings_planted:
-                    sx, sy = seedling[0], seedling[1]
-                    dist = np.sqrt((i - sx) ** 2 + (j - sy) ** 2)
-                    min_dist = min(min_dist, dist)
-
-                if len(self.seedlings_planted) > 0:
-                    # Normalize distance to [0, 1]
-                    obs[i, j, 1] = min(min_dist / (self.grid_size * 0.5), 1.0)
-                else:
-                    obs[i, j, 1] = 1.0  # Maximum distance when no seedlings
+        return self._obs
 
-        return obs
+    def _reset_observation(self):
+        """
+        Rebuild the cached observation from the keepout mask. Seedlings are
+        added to it one cell at a time by add_seedling().
+        """
+        self._obs = np.zeros((self.grid_size, self.grid_size, 2), dtype=np.float32)
+        self._obs[:, :, 0] = self.keepout
+        self._obs[:, :, 1] = 1.0  # Maximum distance when no seedlings
 
     def reset(self, seed=None, options=None):
         """
@@ -224,18 +298,28 @@ class ForestEnv(gym.Env):
             observation: Initial observation
             info: Additional information
         """
-        # Reset RNG if seed is provided
+        # Seed self.np_random. A new seed also redraws the keepout pool, so
+        # that the layouts depend only on the seed
+        super().reset(seed=seed)
         if seed is not None:
-            np.random.seed(seed)
-            random.seed(seed)
+            self._mask_pool = None
 
         # Reset state
         self.seedlings_planted = []
+        self._n_planted = 0
+        self._min_dist.fill(np.inf)
         self.previous_carbon = 0.0
         self.num_failed_plantings = 0
 
         # Generate a new random keepout mask
         self.keepout = self.get_random_keepout_mask(self.grid_size)
+        self._reset_observation()
+
+        # Start a fresh seedling file; plantings are appended to it. Line
+        # buffering flushes each line before iLand reads the file.
+        if self._seedling_f is not None:
+            self._seedling_f.close()
+        self._seedling_f = open(self.initialize(self.init_path), "a", buffering=1)
 
         # Return initial observation and info
         info = {"planted_seedlings": 0, "total_carbon": 0.0}
@@ -264,57 +348,119 @@ class ForestEnv(gym.Env):
 
             # Write each seedling
             for x, y, species_idx in self.seedlings_planted:
-                species = self.species_names[species_idx]
-                # Initial DBH (Diameter at Breast Height), height, and age
-                # These are set to small values for seedlings
-                dbh = 2.0  # 2 cm
-                height = 1.0  # 1 meter
-                age = 0  # Just planted
-
-                f.write(f"{x:.2f};{y:.2f};{species};{dbh:.1f};{height:.1f};{age}\n")
+                f.write(self.format_seedling(x, y, species_idx))
 
         return path
 
+    def format_seedling(self, x, y, species_idx):
+        """
+        Format one line of the seedling file for a seedling at (x, y).
+        """
+        species = self.species_names[species_idx]
+        # Initial DBH (Diameter at Breast Height), height, and age
+        # These are set to small values for seedlings
+        dbh = 2.0  # 2 cm
+        height = 1.0  # 1 meter
+        age = 0  # Just planted
+
+        return f"{x:.2f};{y:.2f};{species};{dbh:.1f};{height:.1f};{age}\n"
+
     def run_simulation(self, path="build/python_interface"):
         """
         Run the executable in the path. Wait for it to finish.
         The executable is iLand, which simulates the growth of the forest stand.
         It reads from the text file created by the initialize() method.
+
+        iLand is kept running as a worker process between calls, so process
+        startup is only paid once per environment.
         """
 
-        try:
-            # Run the command and wait for it to complete
-            result = subprocess.run(path, check=True, capture_output=True, text=True)
+        self._worker_carbon = None
 
-            # Check if the simulation was successful
-            if result.returncode == 0:
-                return True
-            else:
-                print(f"Simulation failed with return code {result.returncode}")
-                print(f"Error output: {result.stderr}")
-                return False
+        try:
+            if self._proc is None or self._proc.poll() is not None:
+                self._proc = subprocess.Popen(
+                    [path, self.xml_path, "--worker"],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    text=True,
+                    bufsize=1,
+                )
 
-        except subprocess.CalledProcessError as e:
-            print(f"Error running simulation: {e}")
+            self._proc.stdin.write(f"RUN {self.years}\n")
+            self._proc.stdin.flush()
+
+            # iLand also logs to stdout; the reply is the first OK/ERR line
+            for line in self._proc.stdout:
+                if line.startswith("OK"):
+                    # "OK <total carbon kg>"
+                    fields = line.split()
+                    if len(fields) > 1:
+                        self._worker_carbon = float(fields[1])
+                    return True
+                if line.startswith("ERR"):
+                    print(f"Simulation failed: {line.strip()}")
+                    return False
+
+            print(f"Simulation failed with return code {self._proc.wait()}")
+            self._proc = None
             return False
+
         except Exception as e:
             print(f"Unexpected error: {e}")
             return False
 
+    def _stop_worker(self):
+        """
+        Ask the iLand worker to exit and wait for it.
+        """
+        if self._proc is None:
+            return
+
+        try:
+            if self._proc.poll() is None:
+                self._proc.stdin.write("QUIT\n")
+                self._proc.stdin.flush()
+            self._proc.wait(timeout=10)
+        except Exception as e:
+            print(f"Error stopping simulation worker: {e}")
+            self._proc.kill()
+        self._proc = None
+
     def read_output(self) -> tuple[pd.DataFrame, float]:
         """
-        Read the output from the SQLite database file.
-        The database file is created by the simulation.
+        Read the output of the last simulation.
+
+        With carbon_source="worker" the total carbon is taken from the iLand
+        worker's reply, falling back to SQLite if the reply had no total.
+        Otherwise it is aggregated inside the output database, by SQLite or
+        DuckDB. The full tree table is only read when debug_output is set.
 
         Returns:
-            tuple: A tuple containing the tree data and the total carbon in the final year.
+            tuple: A tuple containing the tree data (None unless debug_output
+            is set) and the total carbon in the final year (None on failure).
         """
+        if not self.debug_output:
+            if self.carbon_source == "worker" and self._worker_carbon is not None:
+                return None, self._worker_carbon
+
+            if self._db_conn is None:
+                if self.carbon_source == "duckdb":
+                    self._db_conn = connect_output_duckdb(self.db_path)
+                else:
+                    self._db_conn = connect_output(self.db_path)
+                if self._db_conn is None:
+                    return None, None
+
+            return None, read_carbon(self._db_conn)
+
         # Read the tree data from the SQLite database
-        tree_data = read_table(table_name="tree")
+        tree_data = read_table(self.db_path, table_name="tree")
 
         if tree_data is None:
             print("Error: Could not read the tree table.")
-            return None, 0.0
+            return None, None
 
         # Find the maximum year in the dataset
         final_year = tree_data["year"].max()
@@ -329,11 +475,41 @@ class ForestEnv(gym.Env):
         Check if a new seedling at (x,y) would be too close to any existing seedling.
         Returns True if the location is valid (not too close), False otherwise.
         """
-        for sx, sy, _ in self.seedlings_planted:
-            dist = np.sqrt((x - sx) ** 2 + (y - sy) ** 2)
-            if dist < min_distance:
-                return False  # Too close to an existing seedling
-        return True  # Valid location
+        if self._n_planted == 0:
+            return True
+
+        # Distances from the new point to all existing seedlings at once
+        min_dist = nearest_distance(self._points[: self._n_planted], float(x), float(y))
+        return bool(min_dist >= min_distance)
+
+    def add_seedling(self, x, y, species_idx):
+        """
+        Record a planted seedling and fold its distances into the running
+        per-cell minimum used for the observation's distance channel.
+        """
+        self.seedlings_planted.append((x, y, species_idx))
+
+        # Grow the point buffer if more seedlings are planted than expected
+        if self._n_planted == len(self._points):
+            capacity = 2 * len(self._points) + 1
+            self._points = np.resize(self._points, (capacity, 2))
+            self._cells = np.resize(self._cells, (capacity, 2))
+            self._species_idx = np.resize(self._species_idx, capacity)
+        grid_x = int(min(max(0, x), self.grid_size - 1))
+        grid_y = int(min(max(0, y), self.grid_size - 1))
+        self._points[self._n_planted] = (x, y)
+        self._cells[self._n_planted] = (grid_x, grid_y)
+        self._species_idx[self._n_planted] = species_idx
+        self._n_planted += 1
+
+        update_min_distance(self._min_dist, float(x), float(y))
+
+        # Only the planted cell and the distance channel change
+        self._obs[grid_x, grid_y, 0] = species_idx + 2
+        # Normalize distance to [0, 1]
+        np.minimum(
+            self._min_dist / (self.grid_size * 0.5), 1.0, out=self._obs[:, :, 1]
+        )
 
     def step(self, action):
         """
@@ -394,11 +570,79 @@ class ForestEnv(gym.Env):
             return self.get_observation(), reward, terminated, truncated, info
 
         # Add the seedling to our list
-        self.seedlings_planted.append((x, y, species_idx))
+        self.add_seedling(x, y, species_idx)
+
+        # Append the new seedling to the file read by the simulation
+        self._seedling_f.write(self.format_seedling(x, y, species_idx))
+
+        reward, terminated, truncated = self.simulate(info)
+        return self.get_observation(), reward, terminated, truncated, info
+
+    def step_batch(self, actions):
+        """
+        Plant several seedlings at once and run the simulation a single time
+        for all of them, amortizing the simulation cost over the batch.
+
+        Args:
+            actions: A (K, 3) array of [-1, 1] values, one row per seedling,
+                     laid out like the action of step()
+
+        Returns:
+            observation: The updated state
+            reward: The carbon improvement of the batch, minus the invalid
+                    planting penalty for every rejected action
+            terminated: Whether the episode is done
+            truncated: Whether the episode was truncated
+            info: Additional information, with one entry per action in
+                  "valid_planting"
+        """
+        actions = np.asarray(actions, dtype=np.float32).reshape(-1, 3)
+        num_species = len(self.species_names)
+
+        # Normalize all actions from [-1, 1] to grid coordinates and species
+        locations = (actions[:, :2] + 1) / 2 * self.grid_size
+        species_idxs = ((actions[:, 2] + 1) / 2 * (num_species - 1)).astype(int)
+        species_idxs = np.clip(species_idxs, 0, num_species - 1)
+
+        # Check the keepout mask for the whole batch at once
+        cells = np.clip(locations, 0, self.grid_size - 1).astype(int)
+        valid = ~self.keepout[cells[:, 1], cells[:, 0]]
+
+        # Seedlings in the same batch must also keep their distance from
+        # each other, so the remaining checks run in order
+        for k in np.flatnonzero(valid):
+            x, y = locations[k]
+            if not self.check_distance_to_existing_seedlings(x, y, min_distance=0.5):
+                valid[k] = False
+                continue
+            self.add_seedling(x, y, int(species_idxs[k]))
+            self._seedling_f.write(self.format_seedling(x, y, int(species_idxs[k])))
+
+        num_failed = int(len(actions) - valid.sum())
+        self.num_failed_plantings += num_failed
+        penalty = -10.0 * num_failed  # Penalty for planting in invalid locations
+
+        info = {
+            "planted_seedlings": len(self.seedlings_planted),
+            "valid_planting": valid,
+        }
+
+        if not valid.any():
+            # Truncate if too many failed plantings
+            truncated = self.num_failed_plantings > 10
+            return self.get_observation(), penalty, False, truncated, info
 
-        # Initialize the simulation with the updated seedlings
-        self.initialize()
+        reward, terminated, truncated = self.simulate(info)
+        return self.get_observation(), reward + penalty, terminated, truncated, info
+
+    def simulate(self, info):
+        """
+        Run the simulation for the current seedlings and compute the reward.
+        Results are added to info.
 
+        Returns:
+            tuple: reward, terminated, truncated
+        """
         # Run the simulation
         sim_success = self.run_simulation()
 
@@ -407,17 +651,17 @@ class ForestEnv(gym.Env):
             reward = -10.0  # Larger penalty for simulation failure
             terminated = True  # End the episode
             truncated = True
-            return self.get_observation(), reward, terminated, truncated, info
+            return reward, terminated, truncated
 
         # Read the simulation results
         tree_data, current_carbon = self.read_output()
 
-        # If tree_data is None, simulation gave no valid output
-        if tree_data is None:
+        # If current_carbon is None, simulation gave no valid output
+        if current_carbon is None:
             reward = -5.0  # Penalty for invalid output
             terminated = True
             truncated = True
-            return self.get_observation(), reward, terminated, truncated, info
+            return reward, terminated, truncated
 
         # Calculate reward as the improvement in carbon storage
         carbon_improvement = current_carbon - self.previous_carbon
@@ -436,7 +680,7 @@ class ForestEnv(gym.Env):
         info["total_carbon"] = current_carbon
         info["carbon_improvement"] = carbon_improvement
 
-        return self.get_observation(), reward, terminated, truncated, info
+        return reward, terminated, truncated
 
     def render(self):
         """
@@ -456,28 +700,20 @@ class ForestEnv(gym.Env):
             )
             print(f"Total carbon: {self.previous_carbon:.2f} kg")
 
-            # Print a simplified view of the forest
-            grid = np.zeros((self.grid_size, self.grid_size), dtype=str)
-            grid.fill(".")  # Empty space
-            grid[self.keepout] = "X"  # Keepout areas
+            # Print a simplified view of the forest, built as character codes
+            grid = np.full((self.grid_size, self.grid_size), ord("."), dtype=np.uint8)
+            grid[self.keepout] = ord("X")  # Keepout areas
 
-            for x, y, species_idx in self.seedlings_planted:
-                grid_x = int(min(max(0, x), self.grid_size - 1))
-                grid_y = int(min(max(0, y), self.grid_size - 1))
-                # Use a letter for each species (A for species 0, B for species 1, etc.)
-                species_letter = chr(65 + species_idx % 26)  # A-Z for species
-                grid[grid_y, grid_x] = species_letter
+            # Use a letter for each species (A for species 0, B for species 1, etc.)
+            n = self._n_planted
+            grid_x, grid_y = self._cells[:n].T
+            grid[grid_y, grid_x] = 65 + self._species_idx[:n] % 26  # A-Z for species
 
             # Print a subset of the grid to avoid flooding the console
             subset_size = min(20, self.grid_size)
-            for i in range(subset_size):
-                row = grid[i * self.grid_size // subset_size]
-                print(
-                    "".join(
-                        row[j * self.grid_size // subset_size]
-                        for j in range(subset_size)
-                    )
-                )
+            sample = np.arange(subset_size) * self.grid_size // subset_size
+            for row in grid[np.ix_(sample, sample)]:
+                print(row.tobytes().decode("ascii"))
 
             # Print species legend
             print("\nSpecies Legend:")
@@ -486,68 +722,54 @@ class ForestEnv(gym.Env):
                 print(f"{species_letter}: {species}")
 
         elif self.render_mode == "human":
-            # Create a color-coded visualization
-            plt.figure(figsize=(10, 10))
-
-            # Create an RGB image
+            # Create a color-coded visualization as an RGB image
             rgb_img = np.zeros((self.grid_size, self.grid_size, 3), dtype=np.uint8)
 
             # Set different colors for different elements
             # Keepout areas (red)
             rgb_img[self.keepout] = [255, 0, 0]
 
-            # Define a distinct color palette for different species
-            # Using HSV color space for better color separation
-            species_colors = []
-            for i in range(len(self.species_names)):
-                # Distribute hues evenly around the color wheel
-                hue = i / len(self.species_names)
-                # Convert HSV to RGB (simplified conversion)
-                if hue < 1 / 6:
-                    r, g, b = 255, int(255 * 6 * hue), 0
-                elif hue < 2 / 6:
-                    r, g, b = int(255 * (2 - 6 * hue)), 255, 0
-                elif hue < 3 / 6:
-                    r, g, b = 0, 255, int(255 * (6 * hue - 2))
-                elif hue < 4 / 6:
-                    r, g, b = 0, int(255 * (4 - 6 * hue)), 255
-                elif hue < 5 / 6:
-                    r, g, b = int(255 * (6 * hue - 4)), 0, 255
-                else:
-                    r, g, b = 255, 0, int(255 * (6 - 6 * hue))
-                species_colors.append([r, g, b])
-
             # Planted seedlings with species-specific colors
-            for x, y, species_idx in self.seedlings_planted:
-                grid_x = int(min(max(0, x), self.grid_size - 1))
-                grid_y = int(min(max(0, y), self.grid_size - 1))
-
-                # Use the pre-defined color for this species
-                color = species_colors[species_idx % len(species_colors)]
-                rgb_img[grid_y, grid_x] = color
-
-            plt.imshow(rgb_img)
-            plt.title(
-                f"Seedlings: {len(self.seedlings_planted)}/{self.total_seedlings}, Carbon: {self.previous_carbon:.2f} kg"
-            )
-
-            # Add a legend for species colors
-            from matplotlib.patches import Patch
-
-            legend_elements = [
-                Patch(
-                    facecolor=np.array(species_colors[i]) / 255,
-                    label=f"{self.species_names[i]}",
+            n = self._n_planted
+            grid_x, grid_y = self._cells[:n].T
+            rgb_img[grid_y, grid_x] = self._species_colors[self._species_idx[:n]]
+
+            title = f"Seedlings: {len(self.seedlings_planted)}/{self.total_seedlings}, Carbon: {self.previous_carbon:.2f} kg"
+
+            if self._fig is None:
+                # Create the figure once and only update its image afterwards
+                self._fig, self._ax = plt.subplots(figsize=(10, 10))
+                self._image = self._ax.imshow(rgb_img)
+
+                # Add a legend for species colors
+                legend_elements = [
+                    Patch(
+                        facecolor=self._species_colors[i] / 255,
+                        label=f"{self.species_names[i]}",
+                    )
+                    for i in range(len(self.species_names))
+                ]
+                self._ax.legend(
+                    handles=legend_elements, loc="lower right", title="Species"
                 )
-                for i in range(len(self.species_names))
-            ]
-            plt.legend(handles=legend_elements, loc="lower right", title="Species")
 
-            plt.axis("off")
-            plt.tight_layout()
+                self._ax.axis("off")
+                self._fig.tight_layout()
+            else:
+                self._image.set_data(rgb_img)
+
+            self._ax.set_title(title)
 
             plt.pause(0.01)  # Small pause to update display
 
     def close(self):
-        if self.render_mode == "human":
-            plt.close("all")
+        self._stop_worker()
+        if self._seedling_f is not None:
+            self._seedling_f.close()
+            self._seedling_f = None
+        if self._db_conn is not None:
+            self._db_conn.close()
+            self._db_conn = None
+        if self._fig is not None:
+            plt.close(self._fig)
+            self._fig = None
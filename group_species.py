@@ -2,50 +2,14 @@ import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
 import matplotlib.pyplot as plt
 import seaborn as sns
 from collections import defaultdict
 import sqlite3
 import os
 
-
-# These are the species for which we have light
-# interference patterns (LIPs)
-shortnames = [
-    "abal",
-    "acca",
-    "acpl",
-    "acps",
-    "algl",
-    "alin",
-    "alvi",
-    "bepe",
-    "cabe",
-    "casa",
-    "coav",
-    "fasy",
-    "frex",
-    "lade",
-    "piab",
-    "pice",
-    "pimu",
-    "pini",
-    "pisy",
-    "poni",
-    "potr",
-    "psme",
-    "qupe",
-    "qupu",
-    "quro",
-    "rops",
-    "saca",
-    "soar",
-    "soau",
-    "tico",
-    "tipl",
-    "ulgl",
-]
+from species import SHORTNAMES as shortnames
 
 
 def get_species_params(filtered_shortnames=None) -> pd.DataFrame:
@@ -64,16 +28,20 @@ def get_species_params(filtered_shortnames=None) -> pd.DataFrame:
         # Connect to SQLite database
         conn = sqlite3.connect("data/all_species_database.sqlite")
 
-        # Query the species table
-        df = pd.read_sql_query("SELECT * FROM species", conn)
+        # Query the species table, filtering in SQL when names are given
+        query = "SELECT * FROM species"
+        params = ()
+        if filtered_shortnames is not None:
+            params = tuple(filtered_shortnames)
+            placeholders = ", ".join("?" * len(params))
+            query += f" WHERE shortName IN ({placeholders})"
+        cursor = conn.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+        df = pd.DataFrame(cursor.fetchall(), columns=columns)
 
         # Close the connection
         conn.close()
 
-        if filtered_shortnames is not None:
-
-            df = df[df["shortName"].isin(filtered_shortnames)]
-
         return df
 
     except sqlite3.Error as e:
@@ -86,21 +54,24 @@ def get_species_params(filtered_shortnames=None) -> pd.DataFrame:
 
 def cluster(df, features, n_components=4, n_clusters=8):
 
-    X = df[features].values
+    # Single precision is plenty for clustering and halves the memory traffic
+    X = df[features].to_numpy(dtype=np.float32)
 
-    # Standardize the features
-    scaler = StandardScaler()
+    # Standardize the features in place
+    scaler = StandardScaler(copy=False)
     X_scaled = scaler.fit_transform(X)
 
     # Perform PCA
-    pca = PCA(n_components=n_components)
+    pca = PCA(n_components=n_components, svd_solver="randomized", random_state=64)
     X_pca = pca.fit_transform(X_scaled)
 
     pca_df = pd.DataFrame(data=X_pca, columns=[f"PC{i+1}" for i in range(n_components)])
     pca_df["shortName"] = df["shortName"].values
 
     # Now cluster
-    kmeans = KMeans(n_clusters=n_clusters, random_state=64)
+    kmeans = MiniBatchKMeans(
+        n_clusters=n_clusters, random_state=64, batch_size=256, n_init=3
+    )
     clusters = kmeans.fit_predict(X_pca)
     pca_df["cluster"] = clusters
 
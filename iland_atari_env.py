@@ -1,4 +1,5 @@
 import shutil
+from functools import lru_cache
 import gymnasium as gym
 from gymnasium import spaces
 import pygame
@@ -6,104 +7,10 @@ import numpy as np
 import pandas as pd
 import subprocess
 import os
-import sqlite3
 import xml.etree.ElementTree as ET
 
-shortnames = [
-    "abal",
-    "acca",
-    "acpl",
-    "acps",
-    "algl",
-    "alin",
-    "alvi",
-    "bepe",
-    "cabe",
-    "casa",
-    "coav",
-    "fasy",
-    "frex",
-    "lade",
-    "piab",
-    "pice",
-    "pimu",
-    "pini",
-    "pisy",
-    "poni",
-    "potr",
-    "psme",
-    "qupe",
-    "qupu",
-    "quro",
-    "rops",
-    "saca",
-    "soar",
-    "soau",
-    "tico",
-    "tipl",
-    "ulgl",
-]
-
-
-def read_table(db_path="output.sqlite", table_name="stand") -> pd.DataFrame:
-    """
-    Read the contents of the 'stand' table from the SQLite database file.
-
-    Args:
-        db_path (str): Path to the SQLite database file
-        table_name (str): Name of the table to read
-
-    Returns:
-        DataFrame: Contents of the 'stand' table
-    """
-    # Check if the file exists
-    if not os.path.isfile(db_path):
-        print(f"Error: Database file '{db_path}' not found.")
-        return None
-
-    try:
-        # Connect to SQLite database
-        conn = sqlite3.connect(db_path)
-
-        # Query the stand table
-        df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-
-        # Close the connection
-        conn.close()
-
-        return df
-
-    except sqlite3.Error as e:
-        print(f"SQLite error: {e}")
-    except Exception as e:
-        print(f"Error: {e}")
-
-    return None
-
-
-def get_total_carbon(data: pd.DataFrame, year: int):
-    # Sum the branch mass for all trees in the final year
-    total_branch_mass = data[data["year"] == year]["branchMass"].sum()
-    # print(f"Total branch mass in the final year: {total_branch_mass:.2f} kg")
-
-    # Same for the stem mass, coarse root mass, and fine root mass
-    total_stem_mass = data[data["year"] == year]["stemMass"].sum()
-    # print(f"Total stem mass in the final year: {total_stem_mass:.2f} kg")
-
-    total_coarse_root_mass = data[data["year"] == year]["coarseRootMass"].sum()
-    # print(f"Total coarse root mass in the final year: {total_coarse_root_mass:.2f} kg")
-
-    total_fine_root_mass = data[data["year"] == year]["fineRootMass"].sum()
-    # print(f"Total fine root mass in the final year: {total_fine_root_mass:.2f} kg")
-
-    total_carbon_kg = (
-        total_branch_mass
-        + total_stem_mass
-        + total_coarse_root_mass
-        + total_fine_root_mass
-    ) * 0.5  # 50% of the mass is carbon
-
-    return total_carbon_kg
+from iland_output import connect_output, get_total_carbon, read_carbon, read_table
+from species import SHORTNAMES as shortnames, SPECIES_INDEX as SPECIES_ID
 
 
 def shortname_to_color(shortname: str, cluster: int) -> tuple[int, int, int]:
@@ -136,21 +43,72 @@ def shortname_to_color(shortname: str, cluster: int) -> tuple[int, int, int]:
     return (r, g, b)
 
 
+# Species are carried around as int8 codes: their index in `shortnames`
+SHORTNAME_ARRAY = np.array(shortnames, dtype=object)
+
+# Display color of every (species code, cluster) pair
+N_CLUSTERS = 6
+COLOR_TABLE = np.array(
+    [
+        [shortname_to_color(name, cluster) for cluster in range(N_CLUSTERS)]
+        for name in shortnames
+    ],
+    dtype=np.uint8,
+)
+
+
+@lru_cache(maxsize=None)
+def load_species_clusters(path="pca_species_clusters.csv"):
+    """
+    Read the species clusters written by group_species.py. Called on first
+    use rather than at import, and cached for the rest of the process.
+
+    Args:
+        path (str): Path to the CSV file with 'shortName' and 'cluster' columns
+
+    Returns:
+        dict: A dict from cluster to an int8 array of its species codes
+    """
+    cluster_df = pd.read_csv(
+        path,
+        usecols=["shortName", "cluster"],
+        dtype={"shortName": str, "cluster": "int8"},
+        engine="c",
+    )
+
+    return {
+        int(cluster): np.array(
+            [SPECIES_ID[name] for name in group["shortName"]], dtype=np.int8
+        )
+        for cluster, group in cluster_df.groupby("cluster")
+    }
+
+
+@lru_cache(maxsize=None)
+def read_project_template(path: str) -> str:
+    """
+    Read an iLand project file. The result is cached, since every
+    environment in a process starts from the same template.
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        return f.read()
+
+
 class Seedling:
-    cluster_df = pd.read_csv("pca_species_clusters.csv")
+    __slots__ = ("cluster", "x", "y", "species_id", "species", "color")
 
-    def __init__(self, cluster: int, x, y):
+    def __init__(self, cluster: int, x, y, rng: np.random.Generator = None):
         self.cluster = cluster
         self.x = x
         self.y = y
 
-        species_in_cluster = Seedling.cluster_df[
-            Seedling.cluster_df["cluster"] == cluster
-        ]
-
-        # Randomly select a species from the cluster
-        self.species = species_in_cluster.sample(n=1).iloc[0]["shortName"]
-        self.color = shortname_to_color(self.species, cluster)
+        # Randomly select a species from the cluster, using the caller's
+        # generator so that seeding the environment makes this reproducible
+        if rng is None:
+            rng = np.random.default_rng()
+        self.species_id = int(rng.choice(load_species_clusters()[cluster]))
+        self.species = shortnames[self.species_id]
+        self.color = COLOR_TABLE[self.species_id, cluster]
 
 
 class ForestEnv(gym.Env):
@@ -163,17 +121,31 @@ class ForestEnv(gym.Env):
         num_seedlings=10,
         process_index=1,
         max_steps=100,
+        debug_output=False,
     ):
 
         self.size = size  # The size of the square grid
         self.window_size = 512  # The size of the PyGame window
         self.num_seedlings = num_seedlings  # The number of seedlings to plant
 
-        self.seedlings: list[Seedling] = []
+        # Planted seedlings as parallel arrays, in planting order
+        self._seed_xs = np.zeros(num_seedlings, dtype=np.int16)
+        self._seed_ys = np.zeros(num_seedlings, dtype=np.int16)
+        self._seed_species = np.zeros(num_seedlings, dtype=np.int8)
+        self._n_planted = 0
+        # Which grid cells already hold a seedling, indexed by [x, y]
+        self._occupied = np.zeros((size, size), dtype=bool)
+        # The seedlings alone, and the observation with the agent drawn on top.
+        # Both are updated in place, one cell at a time, and never handed out:
+        # _get_obs() returns copies
+        self._ground = np.zeros((size, size, 3), dtype=np.uint8)
+        self._obs_buf = np.zeros((size, size, 3), dtype=np.uint8)
+        self._agent_drawn_at = (0, 0)
         self.previous_carbon = 0.0  # Previous carbon storage for reward calculation
         self.total_steps = 0
         self.max_steps = max_steps  # Maximum number of steps in an episode
 
+        self.debug_output = debug_output  # Read the full tree table from SQLite
         self.process_index = process_index  # Process index for file management
         self._set_up_process_files()
 
@@ -191,10 +163,10 @@ class ForestEnv(gym.Env):
         I.e. 0 corresponds to "right", 1 to "up" etc.
         """
         self._action_to_direction = {
-            0: np.array([1, 0]),
-            1: np.array([0, 1]),
-            2: np.array([-1, 0]),
-            3: np.array([0, -1]),
+            0: (1, 0),
+            1: (0, 1),
+            2: (-1, 0),
+            3: (0, -1),
         }
 
         assert render_mode is None or render_mode in self.metadata["render_modes"]
@@ -209,77 +181,82 @@ class ForestEnv(gym.Env):
         """
         self.window = None
         self.clock = None
+        self._frame = None
+        self._canvas = None
+
+        self._db_conn = None  # Connection to the output database, opened on first read
 
     def _set_up_process_files(self):
         base_dir = "/home/main/iland-model/data/"
         process_dir = os.path.join(base_dir, f"process_{self.process_index}")
 
-        # Create the directory if it doesn't exist
+        # Start from an empty directory, removing any previous contents
+        # (including non-empty subdirectories)
+        shutil.rmtree(process_dir, ignore_errors=True)
         os.makedirs(process_dir, exist_ok=True)
 
-        # Clear the directory
-        for filename in os.listdir(process_dir):
-            file_path = os.path.join(process_dir, filename)
-            try:
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-                elif os.path.isdir(file_path):
-                    os.rmdir(file_path)
-            except Exception as e:
-                print(f"Error deleting file {file_path}: {e}")
-
-        # Copy the xml file to the process directory
+        # Write a copy of the project file for this process, pointing its
+        # output database into the process directory
         xml_file = "/home/main/iland-model/data/project.xml"
         dest_xml_file = os.path.join(process_dir, "project.xml")
-        try:
-            if os.path.isfile(dest_xml_file):
-                os.remove(dest_xml_file)
-            shutil.copy(xml_file, dest_xml_file)
-        except Exception as e:
-            print(f"Error copying file {xml_file} to {dest_xml_file}: {e}")
+        output_path = os.path.join(process_dir, "output.sqlite")
 
         self.xml_path = dest_xml_file
         self.process_dir = process_dir
 
-        # Read the xml file to change a few parameters
         try:
-            tree = ET.parse(self.xml_path)
-            root = tree.getroot()
-
-            # Print the elements in the root
-            for elem in root.iter():
-                if elem.text == "output.sqlite":
-                    elem.text = os.path.join(process_dir, "output.sqlite")
-                    print("Found output.sqlite, changed to:", elem.text)
-
-            # Write the changes back to the XML file
-            tree.write(self.xml_path)
+            template = read_project_template(xml_file)
+
+            if template.count(">output.sqlite<") == 1:
+                # The usual case: a plain text substitution is enough
+                xml_text = template.replace(">output.sqlite<", f">{output_path}<")
+                with open(dest_xml_file, "w", encoding="utf-8", newline="") as f:
+                    f.write(xml_text)
+                n_replaced = 1
+            else:
+                # Otherwise rewrite every element whose text is output.sqlite
+                root = ET.fromstring(template)
+                n_replaced = 0
+                for elem in root.iter():
+                    if elem.text == "output.sqlite":
+                        elem.text = output_path
+                        n_replaced += 1
+                ET.ElementTree(root).write(dest_xml_file)
+
+            if n_replaced and os.environ.get("ILAND_VERBOSE") == "1":
+                print("Found output.sqlite, changed to:", output_path)
 
         except ET.ParseError as e:
             print(f"Error parsing XML file: {e}")
         except Exception as e:
-            print(f"Error: {e}")
+            print(f"Error writing {dest_xml_file} from {xml_file}: {e}")
 
     def _get_obs(self):
-        obs = np.zeros((self.size, self.size, 3), dtype=np.uint8)
+        """
+        Update the observation buffer for the agent's current location and
+        return a copy of it. Seedlings are drawn into the buffer as they are
+        planted, so only the agent's old and new cells change here. The copy
+        matters: vector envs keep the returned array as the terminal observation
+        and then call reset(), which clears the buffer in place.
+        """
+        obs = self._obs_buf
 
-        # Draw the seedlings
-        for seedling in self.seedlings:
-            obs[seedling.y, seedling.x] = shortname_to_color(
-                seedling.species, seedling.cluster
-            )
+        # Restore the cell the agent was last drawn on
+        prev_x, prev_y = self._agent_drawn_at
+        obs[prev_y, prev_x] = self._ground[prev_y, prev_x]
 
         # Now draw the agent as a semi-opaque white square
-        obs[self._agent_location[1], self._agent_location[0]] = np.mean(
-            [obs[self._agent_location[1], self._agent_location[0]], (255, 255, 255)],
-            axis=0,
-        ).astype(np.uint8)
+        agent_x, agent_y = self._agent_location
+        obs[agent_y, agent_x] = (
+            self._ground[agent_y, agent_x].astype(np.uint16) + 255
+        ) // 2
+        self._agent_drawn_at = self._agent_location
 
-        return obs
+        return obs.copy()
 
     def _get_info(self):
         return {
-            "remaining_seedlings": self.num_seedlings - len(self.seedlings),
+            "remaining_seedlings": self.num_seedlings - self._n_planted,
         }
 
     def reset(self, seed=None, options=None):
@@ -287,9 +264,17 @@ class ForestEnv(gym.Env):
         super().reset(seed=seed)
 
         # Choose the agent's location uniformly at random
-        self._agent_location = self.np_random.integers(0, self.size, size=2, dtype=int)
+        # The location is kept as a tuple of ints, which is cheaper to update
+        # per step than a small NumPy array
+        self._agent_location = tuple(
+            self.np_random.integers(0, self.size, size=2).tolist()
+        )
         self.previous_carbon = 0.0  # Reset previous carbon storage
-        self.seedlings = []  # Reset seedlings
+        self._n_planted = 0  # Reset seedlings
+        self._occupied.fill(False)
+        self._ground.fill(0)
+        self._obs_buf.fill(0)
+        self._agent_drawn_at = self._agent_location
         self.total_steps = 0  # Reset total steps
 
         observation = self._get_obs()
@@ -309,10 +294,12 @@ class ForestEnv(gym.Env):
 
         if action <= 3:
             # Map the action (element of {0,1,2,3}) to the direction we walk in
-            direction = self._action_to_direction[action]
-            # We use `np.clip` to make sure we don't leave the grid
-            self._agent_location = np.clip(
-                self._agent_location + direction, 0, self.size - 1
+            dx, dy = self._action_to_direction[action]
+            # Clamp the new location to make sure we don't leave the grid
+            agent_x, agent_y = self._agent_location
+            self._agent_location = (
+                min(max(agent_x + dx, 0), self.size - 1),
+                min(max(agent_y + dy, 0), self.size - 1),
             )
             observation = self._get_obs()
             info = self._get_info()
@@ -325,17 +312,15 @@ class ForestEnv(gym.Env):
             return observation, 0.0, False, truncated, info
         else:
             # Check if a seedling is already occupying the location
-            for seedling in self.seedlings:
-                if (
-                    seedling.x == self._agent_location[0]
-                    and seedling.y == self._agent_location[1]
-                ):
-                    truncated = self.total_steps >= self.max_steps
-
-                    return self._get_obs(), 0, False, truncated, self._get_info()
+            if self._occupied[self._agent_location]:
+                truncated = self.total_steps >= self.max_steps
+
+                return self._get_obs(), 0, False, truncated, self._get_info()
             # Plant a seedling
             # The action is an integer between 4 and 9, which we can use to index the species
-            self.seedlings.append(Seedling(action - 4, *self._agent_location))
+            self.add_seedling(
+                Seedling(action - 4, *self._agent_location, rng=self.np_random)
+            )
 
         # Initialize the simulation with the updated seedlings
         self.initialize(os.path.join(self.process_dir, "seedling_init.txt"))
@@ -348,17 +333,17 @@ class ForestEnv(gym.Env):
             reward = -10.0  # Larger penalty for simulation failure
             terminated = True  # End the episode
             truncated = True
-            return self._get_obs(), reward, terminated, truncated, info
+            return self._get_obs(), reward, terminated, truncated, self._get_info()
 
         # Read the simulation results
         tree_data, current_carbon = self.read_output()
 
-        # If tree_data is None, simulation gave no valid output
-        if tree_data is None:
+        # If current_carbon is None, simulation gave no valid output
+        if current_carbon is None:
             reward = -5.0  # Penalty for invalid output
             terminated = True
             truncated = True
-            return self._get_obs(), reward, terminated, truncated, info
+            return self._get_obs(), reward, terminated, truncated, self._get_info()
 
         # Calculate reward as the improvement in carbon storage
         carbon_improvement = current_carbon - self.previous_carbon
@@ -370,7 +355,7 @@ class ForestEnv(gym.Env):
         self.previous_carbon = current_carbon
 
         # An episode is done iff the agent has planted the max seedlings
-        terminated = len(self.seedlings) >= self.num_seedlings
+        terminated = self._n_planted >= self.num_seedlings
         if self.total_steps >= self.max_steps:
             truncated = True
             terminated = True
@@ -382,6 +367,28 @@ class ForestEnv(gym.Env):
 
         return observation, reward, terminated, False, info
 
+    def add_seedling(self, seedling: Seedling):
+        """
+        Record a planted seedling and draw it into the observation.
+        """
+        # Grow the arrays if more seedlings are planted than expected
+        if self._n_planted == len(self._seed_xs):
+            capacity = 2 * len(self._seed_xs) + 1
+            self._seed_xs = np.resize(self._seed_xs, capacity)
+            self._seed_ys = np.resize(self._seed_ys, capacity)
+            self._seed_species = np.resize(self._seed_species, capacity)
+        self._seed_xs[self._n_planted] = seedling.x
+        self._seed_ys[self._n_planted] = seedling.y
+        self._seed_species[self._n_planted] = seedling.species_id
+        self._n_planted += 1
+
+        self._occupied[seedling.x, seedling.y] = True
+
+        # The agent highlight on this cell is redrawn by the next _get_obs().
+        # Observations already returned are copies and keep the old contents
+        self._ground[seedling.y, seedling.x] = seedling.color
+        self._obs_buf[seedling.y, seedling.x] = seedling.color
+
     def render(self):
         if self.render_mode == "rgb_array":
             return self._render_frame()
@@ -403,22 +410,27 @@ class ForestEnv(gym.Env):
         # Ensure the directory exists
         os.makedirs(os.path.dirname(path), exist_ok=True)
 
-        # Write the header and seedling data to the file
+        # Initial DBH (Diameter at Breast Height), height, and age
+        # These are set to small values for seedlings, and are the same
+        # for every line: 2 cm, 1 meter, just planted
+        dbh = 2.0
+        height = 1.0
+        age = 0
+        suffix = f";{dbh:.1f};{height:.1f};{age}\n"
+
+        # Build the header and seedling data in memory and write it at once
+        lines = ["x;y;species;dbh;height;age\n"]
+        n = self._n_planted
+        lines.extend(
+            f"{x:.2f};{y:.2f};{species}{suffix}"
+            for x, y, species in zip(
+                self._seed_xs[:n].tolist(),
+                self._seed_ys[:n].tolist(),
+                SHORTNAME_ARRAY[self._seed_species[:n]],
+            )
+        )
         with open(path, "w") as f:
-            f.write("x;y;species;dbh;height;age\n")
-
-            # Write each seedling
-            for seedling in self.seedlings:
-                x = seedling.x
-                y = seedling.y
-                species = seedling.species
-                # Initial DBH (Diameter at Breast Height), height, and age
-                # These are set to small values for seedlings
-                dbh = 2.0  # 2 cm
-                height = 1.0  # 1 meter
-                age = 0  # Just planted
-
-                f.write(f"{x:.2f};{y:.2f};{species};{dbh:.1f};{height:.1f};{age}\n")
+            f.write("".join(lines))
 
         return path
 
@@ -427,26 +439,34 @@ class ForestEnv(gym.Env):
         Run the executable in the path. Wait for it to finish.
         The executable is iLand, which simulates the growth of the forest stand.
         It reads from the text file created by the initialize() method.
+
+        iLand's log output is discarded unless rendering for a human or the
+        ILAND_VERBOSE environment variable is set to 1, in which case it is
+        captured so that it can be printed on failure.
         """
+        verbose = (
+            self.render_mode == "human" or os.environ.get("ILAND_VERBOSE") == "1"
+        )
 
         try:
             # Run the command and wait for it to complete
             args = [path, self.xml_path, str(years)]
-            result = subprocess.run(args, check=True, capture_output=True, text=True)
+            if verbose:
+                result = subprocess.run(args, capture_output=True, text=True)
+            else:
+                result = subprocess.run(
+                    args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
 
             # Check if the simulation was successful
             if result.returncode == 0:
-                # print(result.stdout)
-                # print(result.stderr)
                 return True
             else:
                 print(f"Simulation failed with return code {result.returncode}")
-                print(f"Error output: {result.stderr}")
+                if verbose:
+                    print(f"Error output: {result.stderr}")
                 return False
 
-        except subprocess.CalledProcessError as e:
-            print(f"Error running simulation: {e}")
-            return False
         except Exception as e:
             print(f"Unexpected error: {e}")
             return False
@@ -456,17 +476,31 @@ class ForestEnv(gym.Env):
         Read the output from the SQLite database file.
         The database file is created by the simulation.
 
+        The total carbon is aggregated inside SQLite. The full tree table is
+        only read when debug_output is set.
+
         Returns:
-            tuple: A tuple containing the tree data and the total carbon in the final year.
+            tuple: A tuple containing the tree data (None unless debug_output
+            is set) and the total carbon in the final year (None on failure).
         """
+        # The database is rewritten in place by every run, so one connection
+        # is opened on first use and kept for the lifetime of the environment
+        if self._db_conn is None:
+            self._db_conn = connect_output(
+                os.path.join(self.process_dir, "output.sqlite")
+            )
+            if self._db_conn is None:
+                return None, None
+
+        if not self.debug_output:
+            return None, read_carbon(self._db_conn)
+
         # Read the tree data from the SQLite database
-        tree_data = read_table(
-            db_path=os.path.join(self.process_dir, "output.sqlite"), table_name="tree"
-        )
+        tree_data = read_table(table_name="tree", conn=self._db_conn)
 
         if tree_data is None:
             print("Error: Could not read the tree table.")
-            return None, 0.0
+            return None, None
 
         # Find the maximum year in the dataset
         final_year = tree_data["year"].max()
@@ -484,26 +518,28 @@ class ForestEnv(gym.Env):
         if self.clock is None and self.render_mode == "human":
             self.clock = pygame.time.Clock()
 
-        canvas = pygame.Surface((self.window_size, self.window_size))
-
-        obs = self._get_obs()
-
-        # Fill the canvas with the observation
-        for y in range(self.size):
-            for x in range(self.size):
-                color = obs[y, x]
-                pygame.draw.rect(
-                    canvas,
-                    color,
-                    (
-                        x * (self.window_size // self.size),
-                        y * (self.window_size // self.size),
-                        self.window_size // self.size,
-                        self.window_size // self.size,
-                    ),
-                )
+        if self._frame is None:
+            # Pixel buffer in surfarray's (x, y) order, plus a view of it split
+            # into one px-by-px block per grid cell
+            px = self.window_size // self.size
+            self._frame = np.zeros((self.window_size, self.window_size, 3), np.uint8)
+            self._cell_blocks = self._frame[: self.size * px, : self.size * px].reshape(
+                self.size, px, self.size, px, 3
+            )
+
+        # step() and reset() redraw the observation buffer before rendering,
+        # so it already holds the current state
+        obs = self._obs_buf
+
+        # Fill the frame with the observation, upscaling each cell to a block
+        self._cell_blocks[...] = obs.transpose(1, 0, 2)[:, None, :, None, :]
 
         if self.render_mode == "human":
+            if self._canvas is None:
+                self._canvas = pygame.Surface((self.window_size, self.window_size))
+            canvas = self._canvas
+            pygame.surfarray.blit_array(canvas, self._frame)
+
             # The following line copies our drawings from `canvas` to the visible window
             self.window.blit(canvas, canvas.get_rect())
             pygame.event.pump()
@@ -513,14 +549,16 @@ class ForestEnv(gym.Env):
             # The following line will automatically add a delay to keep the framerate stable.
             self.clock.tick(self.metadata["render_fps"])
         else:  # rgb_array
-            return np.transpose(
-                np.array(pygame.surfarray.pixels3d(canvas)), axes=(1, 0, 2)
-            )
+            # The frame already holds the pixels, so no pygame surface is needed
+            return self._frame.transpose(1, 0, 2).copy()
 
     def close(self):
         if self.window is not None:
             pygame.display.quit()
             pygame.quit()
+        if self._db_conn is not None:
+            self._db_conn.close()
+            self._db_conn = None
 
 
 def get_action_from_keyboard_input():
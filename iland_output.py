@@ -0,0 +1,169 @@
+"""
+iland_output.py - Reading the SQLite database written by an iLand run
+"""
+
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+
+# Tree table columns that together make up the biomass of a tree
+MASS_COLUMNS = ["branchMass", "stemMass", "coarseRootMass", "fineRootMass"]
+
+# 50% of the mass is carbon
+CARBON_FRACTION = 0.5
+
+_TOTAL_MASS = " + ".join(MASS_COLUMNS)
+
+# Total carbon (kg) in the final simulated year, aggregated inside SQLite
+CARBON_QUERY = (
+    f"SELECT SUM({_TOTAL_MASS}) * {CARBON_FRACTION} "
+    "FROM tree WHERE year = (SELECT MAX(year) FROM tree)"
+)
+
+# Total carbon (kg) of every simulated year, one row per year
+CARBON_BY_YEAR_QUERY = (
+    f"SELECT year, SUM({_TOTAL_MASS}) * {CARBON_FRACTION} "
+    "FROM tree GROUP BY year ORDER BY year"
+)
+
+
+def tune_connection(conn: sqlite3.Connection):
+    """
+    Apply pragmas suited to reading a database. Only read-side settings are
+    used: the journal mode is stored in the file, so a reader must not change
+    it under iLand's writer.
+    """
+    conn.executescript(
+        """
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-65536;
+        PRAGMA mmap_size=1073741824;
+        PRAGMA query_only=1;
+        """
+    )
+
+
+def connect_output(db_path="output.sqlite") -> sqlite3.Connection:
+    """
+    Open a long-lived connection to the simulation output database.
+
+    Args:
+        db_path (str): Path to the SQLite database file
+
+    Returns:
+        Connection: The open connection, or None if the file does not exist
+    """
+    if not os.path.isfile(db_path):
+        print(f"Error: Database file '{db_path}' not found.")
+        return None
+
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    tune_connection(conn)
+    return conn
+
+
+def connect_output_duckdb(db_path="output.sqlite"):
+    """
+    Open a DuckDB connection with the simulation output database attached,
+    so queries run on DuckDB's vectorized engine. Requires the duckdb
+    package; its sqlite extension is installed on first use.
+
+    Args:
+        db_path (str): Path to the SQLite database file
+
+    Returns:
+        DuckDBPyConnection: The open connection, or None if the file does not exist
+    """
+    import duckdb
+
+    if not os.path.isfile(db_path):
+        print(f"Error: Database file '{db_path}' not found.")
+        return None
+
+    conn = duckdb.connect()
+    conn.execute("INSTALL sqlite")
+    conn.execute("LOAD sqlite")
+    conn.execute(f"ATTACH '{db_path}' AS output (TYPE sqlite, READ_ONLY)")
+    conn.execute("USE output")
+    return conn
+
+
+def read_table(
+    db_path="output.sqlite", table_name="stand", conn: sqlite3.Connection = None
+) -> pd.DataFrame:
+    """
+    Read the contents of the 'stand' table from the SQLite database file.
+
+    Args:
+        db_path (str): Path to the SQLite database file
+        table_name (str): Name of the table to read
+        conn (Connection): An open connection to read from instead of db_path.
+            It is left open.
+
+    Returns:
+        DataFrame: Contents of the 'stand' table
+    """
+    if conn is not None:
+        try:
+            return pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
+        except sqlite3.Error as e:
+            print(f"SQLite error: {e}")
+        except Exception as e:
+            print(f"Error: {e}")
+        return None
+
+    # Check if the file exists
+    if not os.path.isfile(db_path):
+        print(f"Error: Database file '{db_path}' not found.")
+        return None
+
+    try:
+        # Connect to SQLite database
+        conn = sqlite3.connect(db_path)
+        tune_connection(conn)
+
+        # Query the stand table
+        df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
+
+        # Close the connection
+        conn.close()
+
+        return df
+
+    except sqlite3.Error as e:
+        print(f"SQLite error: {e}")
+    except Exception as e:
+        print(f"Error: {e}")
+
+    return None
+
+
+def read_carbon(conn):
+    """
+    Return the total carbon (kg) in the final year of the 'tree' table,
+    or None if it could not be read. Works with connections from both
+    connect_output() and connect_output_duckdb().
+    """
+    try:
+        row = conn.execute(CARBON_QUERY).fetchone()
+    except sqlite3.Error as e:
+        print(f"SQLite error: {e}")
+        return None
+    except Exception as e:
+        print(f"Error: {e}")
+        return None
+
+    return row[0] or 0.0
+
+
+def get_total_carbon(data: pd.DataFrame, year: int):
+    # Sum the branch, stem, coarse root and fine root mass for all trees
+    # in the given year, using one year mask and one reduction
+    # Masses are reduced as float32 (half the bandwidth of pandas' float64)
+    # with a float64 accumulator so large stands keep their precision.
+    year_mask = data["year"].to_numpy() == year
+    masses = data.loc[year_mask, MASS_COLUMNS].to_numpy(dtype=np.float32)
+    total_mass = float(masses.sum(dtype=np.float64))
+
+    return total_mass * CARBON_FRACTION
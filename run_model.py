@@ -1,11 +1,30 @@
+import argparse
+import os
 import sqlite3
+import subprocess
+import sys
 import time
+from functools import lru_cache
+import numpy as np
 import pandas as pd
 
-#!/usr/bin/env python3
+from iland_output import (
+    CARBON_BY_YEAR_QUERY,
+    CARBON_FRACTION,
+    MASS_COLUMNS,
+    tune_connection,
+)
+from species import SHORTNAMES
+
+try:
+    import pyarrow  # noqa: F401
 
-import os.path
-import random
+    # read_sql_query only takes dtype_backend from pandas 2.0 on
+    ARROW_AVAILABLE = int(pd.__version__.split(".")[0]) >= 2
+except ImportError:  # pyarrow is optional, pandas' default dtypes are used instead
+    ARROW_AVAILABLE = False
+
+#!/usr/bin/env python3
 
 shortnames = [
     "abal",
@@ -161,107 +180,29 @@ shortnames = [
 ]
 
 
-shortnames = [
-    "abal",
-    "acca",
-    "acpl",
-    "acps",
-    "algl",
-    "alin",
-    "alvi",
-    "bepe",
-    "cabe",
-    "casa",
-    "coav",
-    "fasy",
-    "frex",
-    "lade",
-    "piab",
-    "pice",
-    "pimu",
-    "pini",
-    "pisy",
-    "poni",
-    "potr",
-    "psme",
-    "qupe",
-    "qupu",
-    "quro",
-    "rops",
-    "saca",
-    "soar",
-    "soau",
-    "tico",
-    "tipl",
-    "ulgl",
-    "abal",
-    "acca",
-    "acpl",
-    "acps",
-    "algl",
-    "alin",
-    "alvi",
-    "bepe",
-    "cabe",
-    "casa",
-    "coav",
-    "fasy",
-    "frex",
-    "lade",
-    "piab",
-    "pice",
-    "pimu",
-    "pini",
-    "pisy",
-    "poni",
-    "potr",
-    "psme",
-    "qupe",
-    "qupu",
-    "quro",
-    "rops",
-    "saca",
-    "soar",
-    "soau",
-    "tico",
-    "tipl",
-    "ulgl",
-    "abal",
-    "acca",
-    "acpl",
-    "acps",
-    "algl",
-    "alin",
-    "alvi",
-    "bepe",
-    "cabe",
-    "casa",
-    "coav",
-    "fasy",
-    "frex",
-    "lade",
-    "piab",
-    "pice",
-    "pimu",
-    "pini",
-    "pisy",
-    "poni",
-    "potr",
-    "psme",
-    "qupe",
-    "qupu",
-    "quro",
-    "rops",
-    "saca",
-    "soar",
-    "soau",
-    "tico",
-    "tipl",
-    "ulgl",
-]
+shortnames = SHORTNAMES
+
+
+@lru_cache(maxsize=None)
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Open a read connection to a SQLite database, tuned for reading. The
+    connection is cached, so every reader of the same file shares it.
+
+    Args:
+        db_path (str): Path to the SQLite database file
+
+    Returns:
+        Connection: The open connection
+    """
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    tune_connection(conn)
+    return conn
 
 
-def read_table(db_path="output.sqlite", table_name="stand") -> pd.DataFrame:
+def read_table(
+    db_path="output.sqlite", table_name="stand", use_arrow=False
+) -> pd.DataFrame:
     """
     Read the contents of the 'stand' table from the SQLite database file.
 
@@ -277,14 +218,12 @@ def read_table(db_path="output.sqlite", table_name="stand") -> pd.DataFrame:
         return None
 
     try:
-        # Connect to SQLite database
-        conn = sqlite3.connect(db_path)
-
         # Query the stand table
-        df = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-
-        # Close the connection
-        conn.close()
+        # Build typed Arrow columns directly instead of inferring NumPy dtypes
+        kwargs = {"dtype_backend": "pyarrow"} if use_arrow and ARROW_AVAILABLE else {}
+        df = pd.read_sql_query(
+            f"SELECT * FROM {table_name}", get_connection(db_path), **kwargs
+        )
 
         return df
 
@@ -309,15 +248,10 @@ def get_species_params() -> pd.DataFrame:
         return []
 
     try:
-        # Connect to SQLite database
-        conn = sqlite3.connect("data/all_species_database.sqlite")
-
         # Query the species table
+        conn = get_connection("data/all_species_database.sqlite")
         df = pd.read_sql_query("SELECT * FROM species", conn)
 
-        # Close the connection
-        conn.close()
-
         return df
 
     except sqlite3.Error as e:
@@ -328,29 +262,56 @@ def get_species_params() -> pd.DataFrame:
     return []
 
 
-def get_total_carbon(data: pd.DataFrame, year: int):
-    # Sum the branch mass for all trees in the final year
-    total_branch_mass = data[data["year"] == year]["branchMass"].sum()
-    # print(f"Total branch mass in the final year: {total_branch_mass:.2f} kg")
+def get_carbon_by_year(data: pd.DataFrame) -> pd.Series:
+    """
+    Total carbon (kg) for every year in the tree table, in one bincount pass.
+
+    Args:
+        data (DataFrame): Contents of the 'tree' table
+
+    Returns:
+        Series: Total carbon indexed by year
+    """
+    years = data["year"].to_numpy(np.intp)
+
+    # One contiguous (N, 4) float32 block, so the row sums stream through
+    # half the memory of four separate float64 columns
+    masses = np.stack([data[c].to_numpy(np.float32) for c in MASS_COLUMNS], axis=1)
+
+    # Years are small non-negative integers, so they can index the bins directly
+    mass_by_year = np.bincount(years, weights=masses.sum(axis=1))
+    present = np.flatnonzero(np.bincount(years))
+
+    return pd.Series(CARBON_FRACTION * mass_by_year[present], index=present)
+
+
+def read_carbon_by_year(db_path="output.sqlite") -> pd.Series:
+    """
+    Total carbon (kg) for every year in the 'tree' table, aggregated inside
+    SQLite so that only one row per year is returned.
+
+    Args:
+        db_path (str): Path to the SQLite database file
 
-    # Same for the stem mass, coarse root mass, and fine root mass
-    total_stem_mass = data[data["year"] == year]["stemMass"].sum()
-    # print(f"Total stem mass in the final year: {total_stem_mass:.2f} kg")
+    Returns:
+        Series: Total carbon indexed by year, or None on failure
+    """
+    # Check if the file exists
+    if not os.path.isfile(db_path):
+        print(f"Error: Database file '{db_path}' not found.")
+        return None
 
-    total_coarse_root_mass = data[data["year"] == year]["coarseRootMass"].sum()
-    # print(f"Total coarse root mass in the final year: {total_coarse_root_mass:.2f} kg")
+    try:
+        rows = get_connection(db_path).execute(CARBON_BY_YEAR_QUERY).fetchall()
 
-    total_fine_root_mass = data[data["year"] == year]["fineRootMass"].sum()
-    # print(f"Total fine root mass in the final year: {total_fine_root_mass:.2f} kg")
+        return pd.Series(dict(rows), dtype=float)
 
-    total_carbon_kg = (
-        total_branch_mass
-        + total_stem_mass
-        + total_coarse_root_mass
-        + total_fine_root_mass
-    ) * 0.5  # 50% of the mass is carbon
+    except sqlite3.Error as e:
+        print(f"SQLite error: {e}")
+    except Exception as e:
+        print(f"Error: {e}")
 
-    return total_carbon_kg
+    return None
 
 
 def read_output():
@@ -360,7 +321,7 @@ def read_output():
     #   'basalArea', 'volume_m3', 'age', 'leafArea_m2', 'foliageMass',
     #   'stemMass', 'branchMass', 'fineRootMass', 'coarseRootMass', 'lri',
     #   'lightResponse', 'stressIndex', 'reserve_kg', 'treeFlags'
-    tree_data = read_table(table_name="tree")
+    tree_data = read_table(table_name="tree", use_arrow=True)
 
     if tree_data is None:
         print("Error: Could not read the tree table.")
@@ -373,10 +334,16 @@ def read_output():
     print("\ntree table contents:")
     print(tree_data)
 
-    final_year = tree_data["year"].max()
+    # Carbon for every year in one pass; the last entry is the final year
+    carbon_by_year = get_carbon_by_year(tree_data)
+    if carbon_by_year.empty:
+        print("Error: The tree table is empty.")
+        return tree_data
+
+    final_year = carbon_by_year.index[-1]
     print(f"\nFinal year: {final_year}")
 
-    total_carbon = get_total_carbon(tree_data, final_year)
+    total_carbon = carbon_by_year.iloc[-1]
 
     print(f"Total carbon in the final year: {total_carbon:.2f} kg")
 
@@ -384,11 +351,11 @@ def read_output():
 
 
 def generate_init_file(
-    species_names, path="data/seedling_init.txt", seedling_count=100
+    species_names, path="data/seedling_init.txt", seedling_count=100, seed=None
 ):
     """
     Generate a .txt file that specifies the initial list of trees present in the stand.
-    Overwrite the file if it already exists.
+    Overwrite the file if it already exists. Pass a seed to make it reproducible.
     The first line is: x;y;species;dbh;height;age
 
     Example file has contents:
@@ -402,27 +369,33 @@ def generate_init_file(
     if os.path.isfile(path):
         print(f"File '{path}' already exists. Overwriting it.")
 
-    # Open the file in write mode
-    with open(path, "w") as f:
-        # Write the header
-        f.write("x;y;species;dbh;height;age\n")
-
-        for i in range(seedling_count):
-            x = random.uniform(0, 100)
-            y = random.uniform(0, 100)
-            species = random.choice(species_names)
-            dbh = random.uniform(3.0, 5.0)
-            height = random.uniform(1.0, 3.0)
-            age = 1.0
-
-            # Write the data
-            f.write(f"{x:.2f};{y:.2f};{species};{dbh:.2f};{height:.2f};{age:.2f}\n")
+    # Draw every column at once
+    rng = np.random.default_rng(seed)
+    xs = rng.uniform(0, 100, seedling_count)
+    ys = rng.uniform(0, 100, seedling_count)
+    species = np.asarray(species_names, dtype=object)[
+        rng.integers(0, len(species_names), seedling_count)
+    ]
+    dbhs = rng.uniform(3.0, 5.0, seedling_count)
+    heights = rng.uniform(1.0, 3.0, seedling_count)
+    age = 1.0
+
+    # Format all lines and write the file in one call
+    lines = ["x;y;species;dbh;height;age\n"]
+    lines.extend(
+        f"{x:.2f};{y:.2f};{name};{dbh:.2f};{height:.2f};{age:.2f}\n"
+        for x, y, name, dbh, height in zip(
+            xs.tolist(), ys.tolist(), species, dbhs.tolist(), heights.tolist()
+        )
+    )
+    with open(path, "wb") as f:
+        f.write("".join(lines).encode("ascii"))
 
 
 def run_process(path="build/python_interface"):
     """
-    Run the executable in the path. Wait for it to finish."""
-    import subprocess
+    Run the executable in the path. Wait for it to finish.
+    Its output is streamed to stdout while it runs."""
 
     # Check if the file exists
     if not os.path.isfile(path):
@@ -430,17 +403,31 @@ def run_process(path="build/python_interface"):
         return None
 
     try:
-        # Run the executable
-        result = subprocess.run([path], check=True, capture_output=True, text=True)
-
-        # Print the output
-        print(result.stdout)
-        print(result.stderr)
-
-    except subprocess.CalledProcessError as e:
+        # Run the executable, echoing its output as it is produced. Leaving
+        # the with block closes the pipe and waits for the process
+        with subprocess.Popen(
+            [path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        ) as result:
+            try:
+                for line in result.stdout:
+                    sys.stdout.write(line)
+            except BaseException:
+                # Don't leave iLand running if streaming is interrupted
+                result.kill()
+                raise
+
+    except OSError as e:
         print(f"Error: {e}")
         return None
 
+    if result.returncode != 0:
+        print(f"Error: '{path}' exited with return code {result.returncode}")
+        return None
+
     return result
 
 
@@ -450,16 +437,13 @@ def get_available_lips():
     "data/lip/<shortname>.bin". Return the names of all species with files
     in the directory.
     """
-    import os
-
-    # Get the list of all files in the directory
-    files = os.listdir("data/lip")
-
-    # Filter the files to get only the .bin files
-    bin_files = [f for f in files if f.endswith(".bin")]
-
-    # Extract the short names from the file names
-    shortnames = [f.split(".")[0] for f in bin_files]
+    # Keep the .bin files and strip the extension, in a single directory scan
+    with os.scandir("data/lip") as entries:
+        shortnames = [
+            entry.name[: -len(".bin")]
+            for entry in entries
+            if entry.name.endswith(".bin") and entry.is_file()
+        ]
 
     return shortnames
 
@@ -467,6 +451,13 @@ def get_available_lips():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run iLand once and report the total carbon per year."
+    )
+    parser.add_argument(
+        "--plot", action="store_true", help="plot the total carbon over time"
+    )
+    args = parser.parse_args()
 
     # species_params = get_species_params()
 
@@ -496,21 +487,31 @@ if __name__ == "__main__":
         print("Error: Could not run the process.")
         exit(1)
 
-    tree_data = read_output()
+    # read_output() prints the whole tree table; it is only needed for debugging
+    carbon_by_year = read_carbon_by_year()
+
+    if carbon_by_year is None:
+        print("Error: Could not read the tree table.")
+        exit(1)
+
+    for year, total_carbon in carbon_by_year.items():
+        print(f"Total carbon in year {year}: {total_carbon:.2f} kg")
+
+    if not args.plot:
+        exit(0)
 
-    carbon = []
-    for i in range(11):
-        total_carbon = get_total_carbon(tree_data, i)
-        print(f"Total carbon in year {i}: {total_carbon:.2f} kg")
-        carbon.append(total_carbon)
+    # Plot carbon over time. Matplotlib is only imported when plotting, and
+    # without a display the plot is saved instead of shown
+    import matplotlib
 
-    # Plot carbon over time
+    headless = not os.environ.get("DISPLAY")
+    if headless:
+        matplotlib.use("Agg")
     import matplotlib.pyplot as plt
-    import numpy as np
 
     plt.plot(
-        np.arange(0, 11),
-        carbon,
+        carbon_by_year.index,
+        carbon_by_year.to_numpy(),
         marker="o",
         linestyle="-",
         color="b",
@@ -519,4 +520,7 @@ if __name__ == "__main__":
     plt.xlabel("Year")
     plt.ylabel("Total Carbon (kg)")
     plt.title("Total Carbon Over Time")
-    plt.show()
+    if headless:
+        plt.savefig("carbon_over_time.png")
+    else:
+        plt.show()
@@ -0,0 +1,43 @@
+"""
+species.py - Tree species shared by the environments and training scripts
+"""
+
+# These are the species for which we have light
+# interference patterns (LIPs)
+SHORTNAMES: tuple[str, ...] = (
+    "abal",
+    "acca",
+    "acpl",
+    "acps",
+    "algl",
+    "alin",
+    "alvi",
+    "bepe",
+    "cabe",
+    "casa",
+    "coav",
+    "fasy",
+    "frex",
+    "lade",
+    "piab",
+    "pice",
+    "pimu",
+    "pini",
+    "pisy",
+    "poni",
+    "potr",
+    "psme",
+    "qupe",
+    "qupu",
+    "quro",
+    "rops",
+    "saca",
+    "soar",
+    "soau",
+    "tico",
+    "tipl",
+    "ulgl",
+)
+
+# Position of every species in SHORTNAMES
+SPECIES_INDEX = {name: i for i, name in enumerate(SHORTNAMES)}
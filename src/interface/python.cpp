@@ -1,4 +1,8 @@
+#include <iomanip>
 #include <iostream>
+#include <limits>
+#include <sstream>
+#include <string>
 #include <QCoreApplication>
 
 #include "python.hpp"
@@ -6,12 +10,13 @@
 #include "global.h"
 #include "model.h"
 #include "modelcontroller.h"
+#include "tree.h"
 
-PythonInterface::PythonInterface()
+PythonInterface::PythonInterface() : mTotalCarbon(0.0)
 {
 }
 
-void PythonInterface::run(QString xml_name, int years)
+bool PythonInterface::run(QString xml_name, int years)
 {
 
     // QString xml_name = QCoreApplication::arguments().at(1);
@@ -20,9 +25,9 @@ void PythonInterface::run(QString xml_name, int years)
     // int years = QCoreApplication::arguments().at(2).toInt(&ok);
     if (years < 0)
     {
-        qDebug() << QCoreApplication::arguments().at(2) << "is an invalid number of years to run!";
+        qDebug() << years << "is an invalid number of years to run!";
         // QCoreApplication::quit();
-        return;
+        return false;
     }
 
     // if (!QFile::exists(xml_name))
@@ -44,7 +49,7 @@ void PythonInterface::run(QString xml_name, int years)
             qWarning() << iland_model.lastError();
             qWarning() << "!!!! ERROR !!!!";
             // QCoreApplication::quit();
-            return;
+            return false;
         }
 
         std::cout << "Reading from XML file:" << xml_name.toStdString() << std::endl;
@@ -82,7 +87,7 @@ void PythonInterface::run(QString xml_name, int years)
             qWarning() << iland_model.lastError();
             qWarning() << "!!!! ERROR !!!!";
             // QCoreApplication::quit();
-            return;
+            return false;
         }
         // runJavascript("onCreate");
         qWarning() << "**************************************************";
@@ -96,8 +101,19 @@ void PythonInterface::run(QString xml_name, int years)
             qWarning() << iland_model.lastError();
             qWarning() << "!!!! ERROR !!!!";
             // QCoreApplication::quit();
-            return;
+            return false;
         }
+
+        // Sum the same mass columns the tree output writes, so the caller
+        // does not need to read them back from the output database.
+        double total_mass = 0.0;
+        AllTreeIterator at(iland_model.model());
+        while (Tree *t = at.next())
+        {
+            total_mass += t->biomassBranch() + (t->biomassStem() - t->biomassReserve()) +
+                          t->biomassCoarseRoot() + t->biomassFineRoot();
+        }
+        mTotalCarbon = total_mass * 0.5; // 50% of the mass is carbon
         // runJavascript("onFinish");
 
         qWarning() << "**************************************************";
@@ -108,13 +124,53 @@ void PythonInterface::run(QString xml_name, int years)
     {
         qWarning() << "*** An exception occured ***";
         qWarning() << e.message();
+        return false;
     }
     catch (const std::exception &e)
     {
         qWarning() << "*** An (std)exception occured ***";
         qWarning() << e.what();
+        return false;
     }
     // QCoreApplication::quit();
+    return true;
+}
+
+// Persistent mode: read commands from stdin so the caller can run the model
+// many times without paying process startup for every simulation.
+//   RUN <years>  run the model, reply "OK <total carbon kg>" or "ERR" on its own line
+//   QUIT         exit the worker
+int runWorker(PythonInterface &py, const QString &xml_name)
+{
+    std::string line;
+    while (std::getline(std::cin, line))
+    {
+        std::istringstream command(line);
+        std::string verb;
+        command >> verb;
+        if (verb == "QUIT")
+            break;
+
+        if (verb == "RUN")
+        {
+            int years = 10; // Default value
+            command >> years;
+            if (py.run(xml_name, years))
+            {
+                // Full precision: rewards are differences of consecutive totals
+                std::cout << "OK "
+                          << std::setprecision(std::numeric_limits<double>::max_digits10)
+                          << py.totalCarbon() << std::endl;
+            }
+            else
+                std::cout << "ERR" << std::endl;
+        }
+        else
+        {
+            std::cout << "ERR unknown command: " << verb << std::endl;
+        }
+    }
+    return 0;
 }
 
 int main(int argc, char *argv[])
@@ -128,12 +184,15 @@ int main(int argc, char *argv[])
     // Print the xml name passed as the first argument
     if (argc < 2)
     {
-        std::cerr << "Usage: " << argv[0] << " <xml_name> [years]" << std::endl;
+        std::cerr << "Usage: " << argv[0] << " <xml_name> [years | --worker]" << std::endl;
         return 1;
     }
     QString xml_name = argv[1];
     std::cout << "XML name: " << xml_name.toStdString() << std::endl;
 
+    if (argc > 2 && QString(argv[2]) == "--worker")
+        return runWorker(py, xml_name);
+
     // Print the number of years to run passed as the second argument
     int years = 10; // Default value
     if (argc > 2)
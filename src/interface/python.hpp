@@ -10,7 +10,10 @@ class PythonInterface : public QObject
     Q_OBJECT
 public:
     PythonInterface();
+    double totalCarbon() const { return mTotalCarbon; } ///< carbon (kg) of all trees after the last run
 public slots:
-    void run(QString xml_name, int years); // execute the iLand model
+    bool run(QString xml_name, int years); // execute the iLand model
+private:
+    double mTotalCarbon;
 };
 #endif // PYTHONINTERFACE_H
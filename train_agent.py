@@ -12,6 +12,7 @@ from stable_baselines3.common.logger import configure
 from stable_baselines3.common.env_checker import check_env
 
 from forest_env import ForestEnv
+from species import SHORTNAMES as shortnames
 from matplotlib import pyplot as plt
 
 
@@ -35,42 +36,6 @@ class TensorboardCallback(BaseCallback):
         return True
 
 
-shortnames = [
-    "abal",
-    "acca",
-    "acpl",
-    "acps",
-    "algl",
-    "alin",
-    "alvi",
-    "bepe",
-    "cabe",
-    "casa",
-    "coav",
-    "fasy",
-    "frex",
-    "lade",
-    "piab",
-    "pice",
-    "pimu",
-    "pini",
-    "pisy",
-    "poni",
-    "potr",
-    "psme",
-    "qupe",
-    "qupu",
-    "quro",
-    "rops",
-    "saca",
-    "soar",
-    "soau",
-    "tico",
-    "tipl",
-    "ulgl",
-]
-
-
 def main():
     # Define tree species names
     species_names = shortnames  # Example species
@@ -95,7 +60,10 @@ def main():
         grid_size=100,  # Size of the grid
     )
 
-    check_env(env)  # Check if the environment is valid
+    # Check if the environment is valid. check_env resets and steps the
+    # environment, which runs the simulator, so it is opt-in
+    if os.environ.get("SB3_CHECK_ENV"):
+        check_env(env)
 
     # Wrap environment for logging
     env = Monitor(env, log_dir)
@@ -132,7 +100,12 @@ def main():
         rather than typical normalized image pixels.
         """
 
-        def __init__(self, observation_space: gym.spaces.Box, features_dim: int = 256):
+        def __init__(
+            self,
+            observation_space: gym.spaces.Box,
+            features_dim: int = 256,
+            use_torch_compile: bool = False,
+        ):
             super(CustomCNN, self).__init__(observation_space, features_dim)
 
             # Extract observation shape
@@ -151,6 +124,18 @@ def main():
                 nn.Flatten(),
             )
 
+            # The permuted NHWC observations are channels_last tensors, so keep
+            # the convolution weights in the same layout. Loading a checkpoint
+            # copies into these parameters, so the layout survives PPO.load()
+            self.cnn = self.cnn.to(memory_format=th.channels_last)
+
+            # Per-channel scale: normalize the species channel and keep the
+            # distance channel, which is already in [0, 1], as is. Not saved
+            # with the model, so existing checkpoints still load
+            channel_scale = th.ones(1, n_input_channels, 1, 1)
+            channel_scale[:, 0] = 1.0 / (len(species_names) + 2)
+            self.register_buffer("_channel_scale", channel_scale, persistent=False)
+
             # Compute shape by doing one forward pass
             with th.no_grad():
                 # Create a dummy input
@@ -161,21 +146,21 @@ def main():
 
             self.linear = nn.Sequential(nn.Linear(n_flatten, features_dim), nn.ReLU())
 
+            # Compile both stacks in place, which keeps the state_dict keys of
+            # the eager modules so checkpoints load either way
+            if use_torch_compile and hasattr(nn.Module, "compile"):
+                self.cnn.compile()
+                self.linear.compile()
+
         # Fix the normalization in the CNN
         def forward(self, observations: th.Tensor) -> th.Tensor:
-            # Permute for PyTorch (batch, channel, height, width)
+            # Permute for PyTorch (batch, channel, height, width). This is a
+            # view with channels_last strides, which the scaling below keeps
             observations = observations.permute(0, 3, 1, 2)
 
-            # Normalize species channel and keep distance channel as is
-            species_channel = observations[:, 0:1, :, :].float() / (
-                len(species_names) + 2
-            )
-            distance_channel = observations[
-                :, 1:2, :, :
-            ]  # Already normalized to [0, 1]
-
-            # Combine the channels
-            normalized_obs = th.cat([species_channel, distance_channel], dim=1)
+            # Normalize both channels in one pass, without slicing and
+            # concatenating them
+            normalized_obs = observations.float() * self._channel_scale
 
             # Pass through CNN
             features = self.cnn(normalized_obs)
@@ -183,6 +168,20 @@ def main():
             # Pass through final linear layer
             return self.linear(features)
 
+    # Allow TF32 matmuls on GPUs that support them
+    th.set_float32_matmul_precision("high")
+
+    policy_kwargs = {
+        "features_extractor_class": CustomCNN,
+        "features_extractor_kwargs": {
+            "features_dim": 256,
+            "use_torch_compile": True,
+        },
+        "normalize_images": False,
+        # Deeper network for better pattern recognition
+        "net_arch": [256, 256, 128],
+    }
+
     # Create model
 
     model = PPO(
@@ -201,17 +200,15 @@ def main():
         vf_coef=0.5,
         max_grad_norm=0.5,
         device="auto",
-        policy_kwargs={
-            "features_extractor_class": CustomCNN,
-            "features_extractor_kwargs": {"features_dim": 256},
-            "normalize_images": False,
-            # Deeper network for better pattern recognition
-            "net_arch": [256, 256, 128],
-        },
+        policy_kwargs=policy_kwargs,
     )
 
+    # Rebuild the policy from the current policy_kwargs rather than the
+    # checkpoint's pickled copy, so the loaded model uses this CustomCNN
     model = PPO.load(
-        os.path.join("models", "forest_model_68000_steps.zip"), env=vec_env
+        os.path.join("models", "forest_model_68000_steps.zip"),
+        env=vec_env,
+        custom_objects={"policy_kwargs": policy_kwargs},
     )
     print("LOADED MODEL")
 
@@ -232,13 +229,16 @@ def main():
 
     # Test the trained model
 
+    # One figure for all test episodes, cleared between them
+    fig, ax = plt.subplots()
+
     for j in range(10):
         print("Testing the trained model...")
         obs = vec_env.reset()
         cumulative_reward = 0
         seedlings = []
 
-        plt.figure()
+        ax.clear()
 
         for i in range(300):  # Plant all seedlings
             action, _states = model.predict(obs, deterministic=False)
@@ -270,8 +270,7 @@ def main():
             if grid_x < 0 or grid_x >= 100 or grid_y < 0 or grid_y >= 100:
                 continue
 
-            seedlings.append([grid_x, grid_y, species_names[species_idx]])
-            plt.scatter(x, y, label=species_names[species_idx])
+            seedlings.append((x, y, species_idx))
 
             obs, rewards, dones, info = vec_env.step([action])
             cumulative_reward += rewards[0]
@@ -291,11 +290,20 @@ def main():
             f"Testing completed for step {j}. Cumulative reward: {cumulative_reward:.2f}"
         )
 
-        plt.legend()
-        plt.title(
+        # One scatter per species, instead of a new artist for every seedling
+        if seedlings:
+            xs, ys, species_idxs = map(np.asarray, zip(*seedlings))
+            for species_idx in np.unique(species_idxs):
+                planted = species_idxs == species_idx
+                ax.scatter(xs[planted], ys[planted], label=species_names[species_idx])
+
+        ax.legend()
+        ax.set_title(
             f"Seedlings planted in episode {j}. Total carbon: {cumulative_reward:.2f} kg/year"
         )
-        plt.savefig(f"seedlings_episode_{j}.png")
+        fig.savefig(f"seedlings_episode_{j}.png")
+
+    plt.close(fig)
 
     # Close environment
     vec_env.close()
@@ -1,5 +1,6 @@
 from stable_baselines3.common.env_checker import check_env
 from forest_env import ForestEnv
+from species import SHORTNAMES
 import random
 import os
 import gymnasium as gym
@@ -7,25 +8,18 @@ import numpy as np
 import torch
 import optuna
 from stable_baselines3 import SAC
-from stable_baselines3.common.env_util import make_vec_env
 from stable_baselines3.common.callbacks import BaseCallback, EvalCallback
+from stable_baselines3.common.evaluation import evaluate_policy
 from stable_baselines3.common.monitor import Monitor
-from stable_baselines3.common.vec_env import DummyVecEnv, VecNormalize
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecNormalize
 from stable_baselines3.common.results_plotter import load_results, ts2xy
 from stable_baselines3.common.noise import NormalActionNoise
 from typing import Dict, Any, Union
 from tqdm import trange
 
 
-shortnames = [
-    "abal", "acca", "acpl", "acps", "algl", "alin", "alvi", "bepe",
-    "cabe", "casa", "coav", "fasy", "frex", "lade", "piab", "pice",
-    "pimu", "pini", "pisy", "poni", "potr", "psme", "qupe", "qupu",
-    "quro", "rops", "saca", "soar", "soau", "tico", "tipl", "ulgl",
-]
-
 # Take every 10th name for a smaller set
-shortnames = shortnames[::10]
+shortnames = SHORTNAMES[::10]
 
 
 def set_all_seeds(seed):
@@ -335,12 +329,17 @@ def train_best_agent(best_params):
     save_dir = "sac_checkpoints/"
     os.makedirs(save_dir, exist_ok=True)
     
-    # Create vectorized environment
-    vec_env = make_vec_env(
-        ForestEnv, 
-        n_envs=1, 
-        env_kwargs={"species_names": shortnames}, 
-        monitor_dir=save_dir
+    # Step one environment per process, so that several iLand simulations run
+    # while the model trains. Each one gets its own files via its process index.
+    n_envs = max(1, (os.cpu_count() or 2) // 2)
+    vec_env = SubprocVecEnv(
+        [
+            lambda i=i: Monitor(
+                ForestEnv(species_names=shortnames, process_index=i),
+                os.path.join(save_dir, str(i)),
+            )
+            for i in range(n_envs)
+        ]
     )
     
     # Normalize observations
@@ -348,6 +347,16 @@ def train_best_agent(best_params):
     
     # Convert parameters
     params = best_params.copy()
+
+    # Keep the same amount of history per environment
+    if "buffer_size" in params:
+        params["buffer_size"] *= n_envs
+
+    # Store each observation once instead of as both obs and next_obs, which
+    # halves the replay buffer. SB3 requires timeout handling to be off for
+    # this, so truncated episodes are stored as ended.
+    params["optimize_memory_usage"] = True
+    params["replay_buffer_kwargs"] = dict(handle_timeout_termination=False)
     
     # Handle action noise
     if "use_action_noise" in params and params["use_action_noise"]:
@@ -376,8 +385,17 @@ def train_best_agent(best_params):
         }[net_arch_type]
         params["policy_kwargs"] = dict(net_arch=net_arch)
     
+    # Allow TF32 matmuls on GPUs that support them
+    torch.set_float32_matmul_precision("high")
+
     # Create the model
     model = SAC("MlpPolicy", vec_env, verbose=1, **params)
+
+    # Compile the networks used in every gradient step. Module.compile works in
+    # place, so SAC's actor/critic aliases and the saved state_dict keys are kept
+    if hasattr(torch.nn.Module, "compile"):
+        for module in (model.actor.latent_pi, model.critic, model.critic_target):
+            module.compile()
     
     # Create callback for saving best model
     callback = SaveOnBestTrainingRewardCallback(check_freq=100, log_dir=save_dir, verbose=1)
@@ -396,20 +414,18 @@ def train_best_agent(best_params):
 
 def test_agent(model, env, num_episodes=5):
     """Test the trained agent for a few episodes."""
-    for episode in range(num_episodes):
-        obs, _ = env.reset()
-        done = False
-        total_reward = 0
-        steps = 0
-        
-        while not done:
-            action, _ = model.predict(obs, deterministic=True)
-            obs, reward, terminated, truncated, _ = env.step(action)
-            done = terminated or truncated
-            total_reward += reward
-            steps += 1
-            env.render()
-        
+    episode_rewards, episode_lengths = evaluate_policy(
+        model,
+        env,
+        n_eval_episodes=num_episodes,
+        deterministic=True,
+        render=True,
+        return_episode_rewards=True,
+    )
+
+    for episode, (total_reward, steps) in enumerate(
+        zip(episode_rewards, episode_lengths)
+    ):
         print(f"Episode {episode+1}: Total Reward: {total_reward}, Steps: {steps}")
 
 
@@ -424,6 +440,16 @@ if __name__ == "__main__":
     
     # Test the trained agent
     print("\nTesting the trained agent...")
-    test_env = ForestEnv(species_names=shortnames, render_mode="human")
+    # Normalize test observations with the statistics gathered in training,
+    # taken once from the training environment instead of reloaded from disk
+    test_env = VecNormalize(
+        DummyVecEnv(
+            [lambda: Monitor(ForestEnv(species_names=shortnames, render_mode="human"))]
+        ),
+        training=False,
+        norm_obs=True,
+        norm_reward=False,
+    )
+    test_env.obs_rms = vec_env.obs_rms
     test_agent(model, test_env)
     
\ No newline at end of file